@@ -2,36 +2,84 @@
 """PicoSwitch host daemon - bridges Pico serial commands to Podman and system stats."""
 
 import argparse
+import asyncio
+import atexit
 import glob
+import http.client
+import json
+import logging
 import os
-import re
 import shutil
+import socket
 import subprocess
 import sys
 import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
-import serial
+import serial_asyncio
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+logger = logging.getLogger("picoswitch")
 
 BAUD_RATE = 115200
+STATUS_INTERVAL = 2.0
 COMPOSE_FILE = os.environ.get(
     "PICOSWITCH_COMPOSE_FILE",
     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
                  "..", "llamacpp", "docker-compose.yml")
 )
 
+# The container runtime doesn't change while the daemon runs, so resolve it once
+_PODMAN = shutil.which("podman")
+CONTAINER_CMD = "podman" if _PODMAN else "docker"
+COMPOSE_CMD = [CONTAINER_CMD, "compose"]
 
-def _compose_cmd():
-    """Return the compose command prefix (podman or docker)."""
-    if shutil.which("podman"):
-        return ["podman", "compose"]
-    return ["docker", "compose"]
-
-
-def _container_cmd():
-    """Return the container runtime command (podman or docker)."""
-    if shutil.which("podman"):
-        return "podman"
-    return "docker"
+# Podman REST API socket, queried instead of spawning `podman ps`
+PODMAN_SOCKET = os.environ.get(
+    "PICOSWITCH_PODMAN_SOCKET",
+    os.path.join(os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}"),
+                 "podman", "podman.sock")
+)
+CONTAINER_QUERY = "/v4.0.0/libpod/containers/json?filters=" + urllib.parse.quote(
+    json.dumps({"name": ["llama-server"]})
+)
+_podman_conn = None
+
+# Container state tracked from the runtime's event stream; None while not watching
+EVENTS_CMD = [CONTAINER_CMD, "events", "--filter", "type=container",
+              "--format", "json" if _PODMAN else "{{json .}}"]
+EVENT_STATES = {
+    "create": "starting",
+    "init": "starting",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "died": "stopped",
+    "die": "stopped",
+    "stop": "stopped",
+    "remove": "stopped",
+    "destroy": "stopped",
+}
+EVENTS_MAX_BACKOFF = 30.0
+EVENTS_LINE_LIMIT = 1024 * 1024
+_watched_state = None
+
+# build_status() spawns podman/nvidia-smi, so reuse a recent result
+STATUS_TTL = 1.5
+_status_cache = None
+_status_cache_ts = 0.0
+_status_state = None
+
+# Single worker so blocking queries never share the Podman connection concurrently
+_executor = ThreadPoolExecutor(max_workers=1)
+
+# GPU handles from NVML, populated by init_nvml()
+_nvml_handles = None
 
 
 def find_serial_port():
@@ -45,11 +93,77 @@ def find_serial_port():
     return None
 
 
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=5):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _podman_get(conn):
+    """Issue the container list request on conn and return (status, body)."""
+    conn.request("GET", CONTAINER_QUERY)
+    resp = conn.getresponse()
+    return resp.status, resp.read()
+
+
+def _query_podman_api():
+    """List llama-server containers via the Podman socket, or None if unreachable."""
+    global _podman_conn
+    if _PODMAN is None or not os.path.exists(PODMAN_SOCKET):
+        return None
+    reused = _podman_conn is not None
+    if not reused:
+        _podman_conn = UnixHTTPConnection(PODMAN_SOCKET)
+    try:
+        try:
+            status, body = _podman_get(_podman_conn)
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            if not reused:
+                raise
+            # The API service closes idle connections (and exits when idle), so
+            # a kept-alive connection is often stale; reconnect once
+            _podman_conn.close()
+            _podman_conn = UnixHTTPConnection(PODMAN_SOCKET)
+            status, body = _podman_get(_podman_conn)
+        if status != 200:
+            return None
+        return json.loads(body)
+    except (OSError, http.client.HTTPException, ValueError):
+        _podman_conn.close()
+        _podman_conn = None
+        return None
+
+
 def get_container_state(compose_file):
+    """Return the llama-server state from the event stream, or query it if not watching."""
+    if _watched_state is not None:
+        return _watched_state
+    return query_container_state()
+
+
+def query_container_state():
     """Check if the llama-server container is running."""
+    containers = _query_podman_api()
+    if containers is not None:
+        states = [c.get("State", "").lower() for c in containers]
+        if not states:
+            return "stopped"
+        if "running" in states:
+            return "running"
+        if "created" in states or "restarting" in states:
+            return "starting"
+        return "stopped"
+
     try:
         result = subprocess.run(
-            [_container_cmd(), "ps", "--filter", "name=llama-server",
+            [CONTAINER_CMD, "ps", "--filter", "name=llama-server",
              "--format", "{{.Status}}"],
             capture_output=True, text=True, timeout=5
         )
@@ -65,8 +179,38 @@ def get_container_state(compose_file):
         return "error"
 
 
+def init_nvml():
+    """Initialise NVML and cache GPU handles; falls back to nvidia-smi on failure."""
+    global _nvml_handles
+    if pynvml is None:
+        return
+    try:
+        pynvml.nvmlInit()
+    except pynvml.NVMLError:
+        return
+    try:
+        handles = [pynvml.nvmlDeviceGetHandleByIndex(i)
+                   for i in range(pynvml.nvmlDeviceGetCount())]
+    except pynvml.NVMLError:
+        pynvml.nvmlShutdown()
+        return
+    atexit.register(pynvml.nvmlShutdown)
+    _nvml_handles = handles
+
+
 def get_vram_usage():
-    """Get GPU memory usage from nvidia-smi in MiB."""
+    """Get GPU memory usage in MiB via NVML, or nvidia-smi if unavailable."""
+    if _nvml_handles is not None:
+        try:
+            used_total = 0
+            total_total = 0
+            for handle in _nvml_handles:
+                mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                used_total += mem.used >> 20
+                total_total += mem.total >> 20
+            return used_total, total_total
+        except pynvml.NVMLError:
+            return 0, 0
     try:
         result = subprocess.run(
             ["nvidia-smi", "--query-gpu=memory.used,memory.total",
@@ -89,10 +233,15 @@ def get_vram_usage():
 def get_ram_usage():
     """Get system RAM usage from /proc/meminfo in MiB."""
     try:
-        with open("/proc/meminfo") as f:
-            info = f.read()
-        total = int(re.search(r"MemTotal:\s+(\d+)", info).group(1))
-        available = int(re.search(r"MemAvailable:\s+(\d+)", info).group(1))
+        total = available = None
+        with open("/proc/meminfo", "rb") as f:
+            for line in f:
+                if line.startswith(b"MemTotal:"):
+                    total = int(line.split()[1])
+                elif line.startswith(b"MemAvailable:"):
+                    available = int(line.split()[1])
+                if total is not None and available is not None:
+                    break
         # /proc/meminfo reports in kB
         total_mib = total // 1024
         used_mib = (total - available) // 1024
@@ -101,30 +250,240 @@ def get_ram_usage():
         return 0, 0
 
 
-def docker_up(compose_file):
-    """Start the llama.cpp server."""
-    print("[picoswitch] Starting llama.cpp server...")
-    subprocess.Popen(
-        _compose_cmd() + ["-f", compose_file, "up", "-d"],
+def invalidate_status():
+    """Force the next build_status() call to re-query the system."""
+    global _status_cache_ts
+    _status_cache_ts = 0.0
+
+
+def compose_argv(compose_file, *args):
+    """Build the full compose command line for the given subcommand."""
+    return COMPOSE_CMD + ["-f", compose_file, *args]
+
+
+async def _run_compose(argv, status_dirty):
+    """Run a compose command, flagging the status as dirty when it starts and exits."""
+    loop = asyncio.get_running_loop()
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
     )
+    # Invalidate on the executor so it lands after any in-flight build_status()
+    await loop.run_in_executor(_executor, invalidate_status)
+    status_dirty.set()
+    await proc.wait()
+    await loop.run_in_executor(_executor, invalidate_status)
+    status_dirty.set()
+
+
+async def docker_up(up_argv, status_dirty):
+    """Start the llama.cpp server."""
+    logger.info("Starting llama.cpp server...")
+    await _run_compose(up_argv, status_dirty)
 
 
-def docker_down(compose_file):
+async def docker_down(down_argv, status_dirty):
     """Stop the llama.cpp server."""
-    print("[picoswitch] Stopping llama.cpp server...")
-    subprocess.Popen(
-        _compose_cmd() + ["-f", compose_file, "down"],
-        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-    )
+    logger.info("Stopping llama.cpp server...")
+    await _run_compose(down_argv, status_dirty)
 
 
 def build_status(compose_file):
-    """Build a STAT: response line."""
+    """Build a STAT: response line, cached for STATUS_TTL seconds."""
+    global _status_cache, _status_cache_ts, _status_state
+    now = time.monotonic()
+    if _status_cache is not None and now - _status_cache_ts < STATUS_TTL:
+        return _status_cache
     state = get_container_state(compose_file)
     vram_used, vram_total = get_vram_usage()
     ram_used, ram_total = get_ram_usage()
-    return "STAT:{}|{}|{}|{}|{}".format(state, vram_used, vram_total, ram_used, ram_total)
+    _status_cache = "STAT:{}|{}|{}|{}|{}".format(state, vram_used, vram_total, ram_used, ram_total)
+    _status_cache_ts = now
+    _status_state = state
+    return _status_cache
+
+
+def get_cached_state(compose_file):
+    """Return the container state, reusing the cached status if it is fresh."""
+    build_status(compose_file)
+    return _status_state
+
+
+class PicoProtocol(asyncio.Protocol):
+    """Serial protocol that splits incoming bytes into lines and dispatches commands."""
+
+    def __init__(self, compose_file):
+        self.compose_file = compose_file
+        # The runtime and compose file are fixed for the daemon's lifetime
+        self.up_argv = compose_argv(compose_file, "up", "-d")
+        self.down_argv = compose_argv(compose_file, "down")
+        self.transport = None
+        self.rx_buf = bytearray()
+        self.lines = asyncio.Queue()
+        self.status_dirty = asyncio.Event()
+        self.compose_tasks = set()
+        self.closed = asyncio.get_running_loop().create_future()
+        self.worker = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        # Commands are handled one at a time so ON/OFF keep their order
+        self.worker = asyncio.create_task(self.process_lines())
+        logger.info("Listening...")
+
+    def connection_lost(self, exc):
+        self.worker.cancel()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def data_received(self, data):
+        self.rx_buf.extend(data)
+        if b"\n" not in data:
+            return
+        # Split every complete line in one pass and keep the trailing partial line
+        *lines, rest = self.rx_buf.split(b"\n")
+        self.rx_buf = bytearray(rest)
+        for raw in lines:
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if line:
+                self.lines.put_nowait(line)
+
+    def spawn_compose(self, coro):
+        """Run a compose coroutine in the background, keeping a reference to it."""
+        task = asyncio.create_task(coro)
+        self.compose_tasks.add(task)
+        task.add_done_callback(self.compose_tasks.discard)
+
+    def send(self, msg):
+        self.transport.write((msg + "\n").encode())
+        logger.debug("Sent: %s", msg)
+
+    async def send_status(self):
+        loop = asyncio.get_running_loop()
+        status = await loop.run_in_executor(_executor, build_status, self.compose_file)
+        self.send(status)
+
+    async def needs_compose(self, target):
+        """Return False if the container is already settled in the target state."""
+        # While a compose command is in flight the cached state may not reflect it yet
+        if self.compose_tasks:
+            return True
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(_executor, get_cached_state, self.compose_file)
+        if state == target:
+            logger.info("llama.cpp server already %s, skipping.", target)
+            return False
+        return True
+
+    async def process_lines(self):
+        while True:
+            line = await self.lines.get()
+            logger.debug("Received: %s", line)
+
+            if line == "CMD:ON":
+                if await self.needs_compose("running"):
+                    self.spawn_compose(docker_up(self.up_argv, self.status_dirty))
+
+            elif line == "CMD:OFF":
+                if await self.needs_compose("stopped"):
+                    self.spawn_compose(docker_down(self.down_argv, self.status_dirty))
+
+            elif line == "CMD:STATUS":
+                await self.send_status()
+
+
+async def periodic_status(protocol):
+    """Push a STAT line every STATUS_INTERVAL seconds, or as soon as status_dirty is set."""
+    loop = asyncio.get_running_loop()
+    # Wait for the time remaining to a fixed deadline so pushes don't drift by
+    # however long each status build took
+    next_deadline = loop.time() + STATUS_INTERVAL
+    while True:
+        timeout = max(0.0, next_deadline - loop.time())
+        try:
+            await asyncio.wait_for(protocol.status_dirty.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            next_deadline += STATUS_INTERVAL
+        protocol.status_dirty.clear()
+        await protocol.send_status()
+        if next_deadline < loop.time():
+            # Fell behind (slow query); resync rather than bursting to catch up
+            next_deadline = loop.time() + STATUS_INTERVAL
+
+
+def _parse_event(line):
+    """Return (container name, status) from one JSON event line."""
+    event = json.loads(line)
+    if _PODMAN:
+        return event.get("Name", ""), event.get("Status", "")
+    # Docker: {"Action": ..., "Actor": {"Attributes": {"name": ...}}}
+    name = event.get("Actor", {}).get("Attributes", {}).get("name", "")
+    return name, event.get("Action", "")
+
+
+async def watch_container_events(status_dirty):
+    """Keep _watched_state current from the runtime's event stream, resubscribing with backoff."""
+    global _watched_state
+    loop = asyncio.get_running_loop()
+    backoff = 1.0
+    while True:
+        started = loop.time()
+        proc = None
+        try:
+            # Seed from a one-off query, then subscribe from just before it so any
+            # change made before the events process is listening gets replayed
+            since = str(int(time.time()))
+            state = await loop.run_in_executor(_executor, query_container_state)
+            if state != "error":
+                _watched_state = state
+            proc = await asyncio.create_subprocess_exec(
+                *EVENTS_CMD, "--since", since,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                limit=EVENTS_LINE_LIMIT
+            )
+
+            async for line in proc.stdout:
+                try:
+                    name, status = _parse_event(line)
+                except (ValueError, AttributeError):
+                    continue
+                state = EVENT_STATES.get(status)
+                if state is None or "llama-server" not in name:
+                    continue
+                _watched_state = state
+                await loop.run_in_executor(_executor, invalidate_status)
+                status_dirty.set()
+        except (OSError, ValueError) as e:
+            # ValueError: an event line longer than EVENTS_LINE_LIMIT
+            logger.warning("Could not watch container events: %s", e)
+        finally:
+            _watched_state = None
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+        if loop.time() - started >= EVENTS_MAX_BACKOFF:
+            backoff = 1.0
+        logger.warning("Container event stream ended, retrying in %.0fs", backoff)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, EVENTS_MAX_BACKOFF)
+
+
+async def run(port, compose_file):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await serial_asyncio.create_serial_connection(
+        loop, lambda: PicoProtocol(compose_file), port, baudrate=BAUD_RATE
+    )
+    poller = asyncio.create_task(periodic_status(protocol))
+    watcher = asyncio.create_task(watch_container_events(protocol.status_dirty))
+    try:
+        exc = await protocol.closed
+    finally:
+        poller.cancel()
+        watcher.cancel()
+        transport.close()
+    if exc is not None:
+        raise exc
 
 
 def main():
@@ -132,51 +491,33 @@ def main():
     parser.add_argument("-p", "--port", help="Serial port (auto-detect if omitted)")
     parser.add_argument("-f", "--compose-file", default=COMPOSE_FILE,
                         help="Path to docker-compose.yml")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Log every serial line received and sent")
     args = parser.parse_args()
 
+    logging.basicConfig(format="[picoswitch] %(message)s", level=logging.INFO)
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
     compose_file = os.path.abspath(args.compose_file)
     if not os.path.isfile(compose_file):
-        print(f"Error: compose file not found: {compose_file}", file=sys.stderr)
+        logger.error("Error: compose file not found: %s", compose_file)
         sys.exit(1)
 
     port = args.port or find_serial_port()
     if not port:
-        print("Error: no serial port found. Is the Pico connected?", file=sys.stderr)
+        logger.error("Error: no serial port found. Is the Pico connected?")
         sys.exit(1)
 
-    print(f"[picoswitch] Using serial port: {port}")
-    print(f"[picoswitch] Compose file: {compose_file}")
+    init_nvml()
 
-    ser = serial.Serial(port, BAUD_RATE, timeout=0.1)
-    print("[picoswitch] Listening...")
+    logger.info("Using serial port: %s", port)
+    logger.info("Compose file: %s", compose_file)
 
     try:
-        while True:
-            line = ser.readline().decode("utf-8", errors="ignore").strip()
-            if not line:
-                continue
-
-            print(f"[picoswitch] Received: {line}")
-
-            if line == "CMD:ON":
-                docker_up(compose_file)
-                status = build_status(compose_file)
-                ser.write((status + "\n").encode())
-
-            elif line == "CMD:OFF":
-                docker_down(compose_file)
-                status = build_status(compose_file)
-                ser.write((status + "\n").encode())
-
-            elif line == "CMD:STATUS":
-                status = build_status(compose_file)
-                ser.write((status + "\n").encode())
-                print(f"[picoswitch] Sent: {status}")
-
+        asyncio.run(run(port, compose_file))
     except KeyboardInterrupt:
-        print("\n[picoswitch] Shutting down.")
-    finally:
-        ser.close()
+        logger.info("Shutting down.")
 
 
 if __name__ == "__main__":
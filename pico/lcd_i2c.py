@@ -32,6 +32,7 @@ class LCD:
         self.cols = cols
         self.rows = rows
         self.backlight = MASK_BL
+        self._buf = bytearray(6)
 
         if addr is not None:
             self.addr = addr
@@ -63,11 +64,22 @@ class LCD:
         self._write_byte(val)
         self._pulse_enable(val)
 
+    def _fill(self, buf, i, val, mode):
+        """Encode one byte as six PCF8574 writes (two EN-strobed nibbles) at buf[i]."""
+        high = (val & 0xF0) | mode | self.backlight
+        low = ((val << 4) & 0xF0) | mode | self.backlight
+        buf[i] = high
+        buf[i + 1] = high | MASK_EN
+        buf[i + 2] = high
+        buf[i + 3] = low
+        buf[i + 4] = low | MASK_EN
+        buf[i + 5] = low
+
     def _write(self, val, mode=0):
-        high = (val & 0xF0) | mode
-        low = ((val << 4) & 0xF0) | mode
-        self._write_nibble(high)
-        self._write_nibble(low)
+        # Each I2C byte takes ~22us at 400kHz, which already covers the EN pulse
+        # width and the 37us HD44780 execution time, so no explicit delays
+        self._fill(self._buf, 0, val, mode)
+        self.i2c.writeto(self.addr, self._buf)
 
     def _cmd(self, val):
         self._write(val, 0)
@@ -99,20 +111,30 @@ class LCD:
         self._cmd(addr)
 
     def putstr(self, string):
-        for c in string:
-            self._data(ord(c))
+        buf = bytearray(6 * len(string))
+        for i, c in enumerate(string):
+            self._fill(buf, 6 * i, ord(c), MASK_RS)
+        self.i2c.writeto(self.addr, buf)
+
+    def putchar_at(self, col, row, ch):
+        """Write a single character without touching the rest of the display."""
+        self.move_to(col, row)
+        self._data(ord(ch))
 
     def _pad(self, text):
         """Pad or truncate text to display width."""
         text = text[:self.cols]
         return text + " " * (self.cols - len(text))
 
+    def show_line(self, row, text):
+        """Write a single line, padded/truncated to display width."""
+        self.move_to(0, row)
+        self.putstr(self._pad(text))
+
     def show(self, line1, line2=""):
         """Write both lines at once, padded/truncated to display width."""
-        self.move_to(0, 0)
-        self.putstr(self._pad(line1))
-        self.move_to(0, 1)
-        self.putstr(self._pad(line2))
+        self.show_line(0, line1)
+        self.show_line(1, line2)
 
     def set_backlight(self, on):
         self.backlight = MASK_BL if on else 0
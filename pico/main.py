@@ -17,44 +17,57 @@ lcd = LCD(i2c)
 
 # --- State ---
 last_switch_state = None
+pending_switch = None
+pending_switch_time = 0
 server_state = "unknown"
-vram_used = 0.0
-vram_total = 0.0
-ram_used = 0.0
-ram_total = 0.0
-last_status_time = 0
+# Memory values are in MiB, as sent by the host
+vram_used = 0
+vram_total = 0
+ram_used = 0
+ram_total = 0
 spinner_idx = 0
-STATUS_INTERVAL_MS = 2000
+last_vram_text = None
+last_state_char = None
+last_line2 = None
 DEBOUNCE_MS = 50
+LOOP_MS = 50
 SPINNER = "|/-\\"
 
 # --- Serial helpers ---
 poll = select.poll()
 poll.register(sys.stdin, select.POLLIN)
-read_buf = ""
+stdin = sys.stdin.buffer
+stdout = sys.stdout.buffer
+read_buf = bytearray()
+rx_byte = bytearray(1)
 
-
-def serial_write(msg):
-    sys.stdout.write(msg + "\n")
+# Commands are fixed, so encode them once
+CMD_ON = b"CMD:ON\n"
+CMD_OFF = b"CMD:OFF\n"
+CMD_STATUS = b"CMD:STATUS\n"
 
 
 def serial_readline():
     """Non-blocking read of a full line from USB serial."""
     global read_buf
+    # stdin has no non-blocking bulk read (read(n) waits for all n bytes), so
+    # read whatever poll says is ready one byte at a time into a reused buffer
     while poll.poll(0):
-        ch = sys.stdin.read(1)
-        if ch is None:
+        if not stdin.readinto(rx_byte):
             break
-        if ch == "\n":
-            line = read_buf
-            read_buf = ""
-            return line
-        read_buf += ch
+        if rx_byte[0] == 0x0A:  # "\n"
+            data = bytes(read_buf)
+            read_buf = bytearray()
+            try:
+                return data.decode()
+            except UnicodeError:
+                continue  # drop the corrupted line
+        read_buf.extend(rx_byte)
     return None
 
 
 def parse_status(line):
-    """Parse STAT:<state>|<vram_used>|<vram_total>|<ram_used>|<ram_total>"""
+    """Parse STAT:<state>|<vram_used>|<vram_total>|<ram_used>|<ram_total> (MiB)"""
     global server_state, vram_used, vram_total, ram_used, ram_total
     if not line.startswith("STAT:"):
         return
@@ -63,19 +76,21 @@ def parse_status(line):
         return
     server_state = parts[0]
     try:
-        vram_used = float(parts[1]) / 1024.0   # MiB → GiB
-        vram_total = float(parts[2]) / 1024.0
-        ram_used = float(parts[3]) / 1024.0
-        ram_total = float(parts[4]) / 1024.0
+        vram_used = int(parts[1])
+        vram_total = int(parts[2])
+        ram_used = int(parts[3])
+        ram_total = int(parts[4])
     except ValueError:
         pass
 
 
-def format_gb(val):
-    """Format a float as compact GB value."""
-    if val >= 10:
-        return "{:.0f}G".format(val)
-    return "{:.1f}G".format(val)
+def format_gb(mib):
+    """Format a MiB value as compact GB value."""
+    # Integer arithmetic only (the M0+ has no FPU), rounding once from MiB
+    if mib >= 10 * 1024:
+        return "%dG" % ((mib + 512) // 1024)
+    tenths = (mib * 10 + 512) // 1024
+    return "%d.%dG" % (tenths // 10, tenths % 10)
 
 
 def state_char():
@@ -92,35 +107,46 @@ def state_char():
 
 
 def update_lcd():
+    """Redraw only the parts of the LCD that changed since the last update."""
+    global last_vram_text, last_state_char, last_line2
     vram = "VRAM {}/{}".format(format_gb(vram_used), format_gb(vram_total))
-    line1 = vram[:15]
-    line1 = line1 + " " * (15 - len(line1)) + state_char()
+    vram = vram[:15]
+    ch = state_char()
     line2 = "RAM  {}/{}".format(format_gb(ram_used), format_gb(ram_total))
     try:
-        lcd.show(line1, line2)
+        if vram != last_vram_text:
+            lcd.show_line(0, vram + " " * (15 - len(vram)) + ch)
+            last_vram_text = vram
+            last_state_char = ch
+        elif ch != last_state_char:
+            # Only the state indicator changed (e.g. spinner), so write just that cell
+            lcd.putchar_at(15, 0, ch)
+            last_state_char = ch
+        if line2 != last_line2:
+            lcd.show_line(1, line2)
+            last_line2 = line2
     except OSError:
-        pass
+        # Force a full redraw once the bus recovers
+        last_vram_text = last_state_char = last_line2 = None
 
 
 # --- Main loop ---
 lcd.show("PicoSwitch", "Connecting...")
+# The host pushes STAT every 2s; ask once so the display fills in right away
+stdout.write(CMD_STATUS)
 
 while True:
     now = utime.ticks_ms()
 
     # Read switch (HIGH=ON via pull-up when unconnected, LOW=OFF when grounded)
     raw = switch.value()
-    utime.sleep_ms(DEBOUNCE_MS)
-    if switch.value() == raw:  # stable reading
-        current = "ON" if raw == 1 else "OFF"
-        if current != last_switch_state:
-            last_switch_state = current
-            serial_write("CMD:" + current)
-
-    # Poll for status periodically
-    if utime.ticks_diff(now, last_status_time) >= STATUS_INTERVAL_MS:
-        serial_write("CMD:STATUS")
-        last_status_time = now
+    if raw != pending_switch:
+        pending_switch = raw
+        pending_switch_time = now
+    elif utime.ticks_diff(now, pending_switch_time) >= DEBOUNCE_MS:  # stable reading
+        if raw != last_switch_state:
+            last_switch_state = raw
+            stdout.write(CMD_ON if raw == 1 else CMD_OFF)
 
     # Read any incoming serial data
     line = serial_readline()
@@ -128,4 +154,5 @@ while True:
         parse_status(line)
         update_lcd()
 
-    utime.sleep_ms(50)
+    # Sleep until serial data arrives or the next tick is due
+    poll.poll(LOOP_MS)